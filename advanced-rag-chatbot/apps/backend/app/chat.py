@@ -1,143 +1,149 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import StreamingResponse
-from typing import List, AsyncGenerator
+from functools import lru_cache
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Any, List, AsyncGenerator, AsyncIterator
 import httpx
+import msgspec
 from time import perf_counter
 from loguru import logger
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import json
+import orjson
 from .config import get_settings
-from .db import fetch, execute, ensure_schema
-from .schemas import ChatRequest, ChatResponse, Source, ChatHistoryResponse, ChatHistoryItem
+from .db import fetch_ann, execute
+from .embeddings import get_model, embed_query
+from .semantic_cache import semantic_cache
+from .sessions import cached_history, invalidate_history
+from .schemas import ChatRequest, ChatResponse, Source, ChatHistoryResponse
 
 router = APIRouter(prefix="/api/chat", tags=["chat"]) 
 
-_model: SentenceTransformer | None = None
+# Embeddings are stored L2-normalized, so the negated inner product (<#>) equals
+# cosine similarity without the per-row norm computation. The distance is computed
+# once per candidate; ORDER BY keeps the operator form so the HNSW index is used.
+_RETRIEVE_SQL = """
+WITH cand AS (
+    SELECT c.id AS chunk_id, c.content, e.embedding <#> $1::halfvec AS dist
+    FROM embeddings e
+    JOIN chunks c ON c.id = e.chunk_id
+    ORDER BY e.embedding <#> $1::halfvec ASC
+    LIMIT $3
+)
+SELECT chunk_id, content, -dist AS similarity
+FROM cand
+WHERE -dist >= $2
+ORDER BY dist ASC
+"""
 
 
-def get_model(settings) -> SentenceTransformer:
-    global _model
-    if _model is None:
-      model_name = getattr(settings, "EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
-      _model = SentenceTransformer(model_name)
-    return _model
+# Retrieval defaults are read once; getattr on a missing Settings attribute goes
+# through Pydantic's __getattr__ and raises internally on every request otherwise
+_DEFAULT_TOP_K = int(getattr(get_settings(), "TOP_K_RESULTS", 5))
+_DEFAULT_THRESHOLD = float(getattr(get_settings(), "SIMILARITY_THRESHOLD", 0.0))
 
+_decode_chat_request = msgspec.json.Decoder(ChatRequest)
+# OpenAPI can't introspect a manually decoded body, so publish msgspec's schema for it
+_CHAT_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": msgspec.json.schema_components([ChatRequest])[1]["ChatRequest"]}},
+    }
+}
 
-async def _llm_complete_openrouter(api_key: str, messages: List[dict], model: str) -> str:
-    base_url = "https://openrouter.ai/api/v1"
-    payload = {"model": model, "messages": messages}
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    async with httpx.AsyncClient(timeout=60.0, base_url=base_url) as client:
-        resp = await client.post("/chat/completions", json=payload, headers=headers)
-        if resp.status_code >= 400:
-            logger.error("OpenRouter error {}: {}", resp.status_code, resp.text)
-            raise HTTPException(status_code=502, detail="LLM service error")
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
 
+async def _chat_request(request: Request) -> ChatRequest:
+    try:
+        return _decode_chat_request.decode(await request.body())
+    except (msgspec.ValidationError, msgspec.DecodeError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
-def _as_pgvector(vec: List[float]) -> str:
-    return "[" + ",".join(f"{v:.8f}" for v in vec) + "]"
 
+_SYSTEM_PROMPT = (
+    "You are an assistant that answers questions strictly using the provided context. "
+    "Cite relevant parts concisely. If the answer is not in the context, say you don't know."
+)
 
-@router.get("/history", response_model=ChatHistoryResponse)
-async def get_history(session_id: str = Query(...), limit: int = Query(50, ge=1, le=200)):
-    await ensure_schema()
-    rows = await fetch(
-        """
-        SELECT id, session_id, user_message, assistant_message, source_documents, processing_time_ms, created_at
-        FROM chat_history
-        WHERE session_id = $1
-        ORDER BY created_at DESC
-        LIMIT $2
-        """,
-        session_id,
-        limit,
-    )
-    items: List[ChatHistoryItem] = []
+
+_CONTEXT_MAX_CHARS = get_settings().context_max_chars
+
+
+def _build_messages(query: str, rows: List[Any]) -> List[dict]:
+    # Fill the context budget in similarity order (rows arrive best-first), truncating
+    # the chunk that crosses it, so a few long chunks can't blow up the prompt
+    budget = _CONTEXT_MAX_CHARS
+    picked = []
     for r in rows:
-        src = None
-        if r["source_documents"]:
-            try:
-                src_list = r["source_documents"] if isinstance(r["source_documents"], list) else json.loads(r["source_documents"])  # type: ignore
-                src = [Source(**s) for s in src_list]
-            except Exception:
-                src = None
-        items.append(
-            ChatHistoryItem(
-                id=str(r["id"]),
-                session_id=r["session_id"],
-                user_message=r["user_message"],
-                assistant_message=r["assistant_message"],
-                source_documents=src,
-                processing_time_ms=r["processing_time_ms"],
-                created_at=str(r["created_at"]),
-            )
-        )
-    return ChatHistoryResponse(messages=items)
+        if budget <= 0:
+            break
+        content = r["content"][:budget]
+        picked.append((r["chunk_id"], content))
+        budget -= len(content)
+    # Stable prefix first (instructions + context ordered by chunk id), question last,
+    # so providers with prefix caching reuse the KV cache when retrieval overlaps.
+    context_text = "\n\n".join(content for _, content in sorted(picked, key=lambda p: p[0]))
+    return [
+        {"role": "system", "content": f"{_SYSTEM_PROMPT}\n\nContext:\n{context_text}"},
+        {"role": "user", "content": query},
+    ]
 
 
-@router.post("", response_model=ChatResponse)
-async def chat(req: ChatRequest, settings=Depends(get_settings)):
-    await ensure_schema()
-    t0 = perf_counter()
+# One pooled HTTP/2 client for all OpenRouter calls, so TLS setup is amortized across requests
+_http: httpx.AsyncClient | None = None
 
-    # 1) Embed query
-    model = get_model(settings)
-    q_vec = model.encode([req.query], convert_to_numpy=True, normalize_embeddings=True)[0].tolist()
-    q_vec_pg = _as_pgvector(q_vec)
 
-    # 2) Retrieve top-k similar chunks
-    top_k = req.top_k or int(getattr(settings, "TOP_K_RESULTS", 5))
-    threshold = req.threshold or float(getattr(settings, "SIMILARITY_THRESHOLD", 0.0))
-    rows = await fetch(
-        """
-        SELECT c.id as chunk_id, c.content,
-               1 - (e.embedding <=> q.vector) as similarity
-        FROM embeddings e
-        JOIN chunks c ON c.id = e.chunk_id,
-             (SELECT $1::vector AS vector) AS q
-        WHERE (1 - (e.embedding <=> q.vector)) >= $2
-        ORDER BY e.embedding <=> q.vector ASC
-        LIMIT $3
-        """,
-        q_vec_pg,
-        threshold,
-        top_k,
-    )
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            base_url="https://openrouter.ai/api/v1",
+            http2=True,
+            # Generations can take a while to start, but an unreachable host should fail fast
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http
 
-    if not rows:
-        raise HTTPException(status_code=404, detail="No relevant context found for the query.")
 
-    sources: List[Source] = []
-    context_snippets: List[str] = []
-    for r in rows:
-        sources.append(Source(id=str(r["chunk_id"]), score=float(r["similarity"])) )
-        context_snippets.append(r["content"]) 
+async def close_http() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
 
-    system_prompt = (
-        "You are an assistant that answers questions strictly using the provided context. "
-        "Cite relevant parts concisely. If the answer is not in the context, say you don't know."
-    )
-    context_text = "\n\n".join(context_snippets)
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {req.query}"},
-    ]
+_LLM_MODEL = "qwen/qwen3-coder:free"
 
+
+def _openrouter_api_key(settings) -> str:
     api_key = (
-        get_settings().__dict__.get("OPENROUTER_API_KEY")
-        or get_settings().__dict__.get("HORIZON_ALPHA_API_KEY")
-        or get_settings().embedding_api_key
+        settings.__dict__.get("OPENROUTER_API_KEY")
+        or settings.__dict__.get("HORIZON_ALPHA_API_KEY")
+        or settings.embedding_api_key
     )
     if not api_key:
         raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
+    return api_key
 
-    answer = await _llm_complete_openrouter(api_key, messages, model="qwen/qwen3-coder:free")
 
-    elapsed = int((perf_counter() - t0) * 1000)
+@lru_cache(maxsize=8)
+def _auth_headers(api_key: str) -> dict:
+    # Built once per key; httpx copies request headers, so the dict is never mutated
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+
+async def _llm_complete_openrouter(api_key: str, messages: List[dict], model: str = _LLM_MODEL) -> str:
+    payload = {"model": model, "messages": messages}
+    resp = await _get_http().post("/chat/completions", content=orjson.dumps(payload), headers=_auth_headers(api_key))
+    if resp.status_code >= 400:
+        logger.error("OpenRouter error {}: {}", resp.status_code, resp.text)
+        raise HTTPException(status_code=502, detail="LLM service error")
+    data = orjson.loads(resp.content)
+    return data["choices"][0]["message"]["content"]
+
+
+_FLUSH_TOKENS = 16
+
+
+async def _record_history(req: ChatRequest, answer: str, sources: List[Source], elapsed_ms: int) -> None:
+    # One turn is a single row (sources travel in its jsonb column), so one INSERT is one round trip
     await execute(
         """
         INSERT INTO chat_history (session_id, user_message, assistant_message, source_documents, processing_time_ms)
@@ -146,107 +152,161 @@ async def chat(req: ChatRequest, settings=Depends(get_settings)):
         req.session_id or "anonymous",
         req.query,
         answer,
-        json.dumps([s.dict() for s in sources]),
-        elapsed,
+        [s.dict() for s in sources],
+        elapsed_ms,
     )
+    invalidate_history(req.session_id or "anonymous")
 
-    return ChatResponse(answer=answer, sources=sources, processing_time_ms=elapsed)
 
+async def _store_history(req: ChatRequest, answer: str, sources: List[Source], elapsed_ms: int) -> None:
+    # Streamed answers are stored once the body has gone out, so failures can only be logged
+    try:
+        await _record_history(req, answer, sources, elapsed_ms)
+    except Exception as e:
+        logger.warning("Failed to store chat history: {}", e)
 
-@router.post("/stream")
-async def chat_stream(req: ChatRequest, settings=Depends(get_settings)):
-    await ensure_schema()
 
-    # Prepare context same as non-stream
+async def _iter_sse_data(chunks: AsyncIterator[bytes]) -> AsyncGenerator[List[bytes], None]:
+    """For each network read, yield the payloads of the SSE ``data:`` events it completed."""
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        if b"\r" in buf:
+            # SSE allows CRLF and CR line endings; normalise to LF. A trailing CR may be
+            # the first half of a CRLF split across reads, so it waits for the next read.
+            tail = buf.endswith(b"\r")
+            body = bytes(buf[:-1] if tail else buf).replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            buf = bytearray(body + (b"\r" if tail else b""))
+        batch: List[bytes] = []
+        while True:
+            end = buf.find(b"\n\n")
+            if end < 0:
+                break
+            frame = bytes(buf[:end])
+            del buf[:end + 2]
+            # Per the SSE spec an event's payload is its data: field values joined with LF;
+            # other fields (event:, id:, retry:) and comments are ignored
+            data = [
+                line[6:] if line.startswith(b"data: ") else line[5:]
+                for line in frame.split(b"\n")
+                if line.startswith(b"data:")
+            ]
+            if data:
+                batch.append(b"\n".join(data))
+        yield batch
+
+
+# Returns the page's cached JSON body directly, so FastAPI neither validates nor
+# re-encodes it; `responses=` keeps the schema in the OpenAPI docs.
+@router.get("/history", response_model=None, responses={200: {"model": ChatHistoryResponse}})
+async def get_history(
+    session_id: str = Query(...),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None),
+):
+    return await cached_history(session_id, limit, cursor)
+
+
+# The answer is returned as an ORJSONResponse, so FastAPI skips both validation and
+# jsonable_encoder on the way out
+@router.post("", response_model=None, responses={200: {"model": ChatResponse}}, openapi_extra=_CHAT_REQUEST_OPENAPI)
+async def chat(req: ChatRequest = Depends(_chat_request), settings=Depends(get_settings)):
+    t0 = perf_counter()
+
+    # 1) Embed query
     model = get_model(settings)
-    q_vec = model.encode([req.query], convert_to_numpy=True, normalize_embeddings=True)[0].tolist()
-    q_vec_pg = _as_pgvector(q_vec)
-    top_k = req.top_k or int(getattr(settings, "TOP_K_RESULTS", 5))
-    threshold = req.threshold or float(getattr(settings, "SIMILARITY_THRESHOLD", 0.0))
-    rows = await fetch(
-        """
-        SELECT c.id as chunk_id, c.content,
-               1 - (e.embedding <=> q.vector) as similarity
-        FROM embeddings e
-        JOIN chunks c ON c.id = e.chunk_id,
-             (SELECT $1::vector AS vector) AS q
-        WHERE (1 - (e.embedding <=> q.vector)) >= $2
-        ORDER BY e.embedding <=> q.vector ASC
-        LIMIT $3
-        """,
-        q_vec_pg,
-        threshold,
-        top_k,
-    )
+    q_vec = await embed_query(model, req.query)
+
+    # 2) Retrieve top-k similar chunks
+    top_k = req.top_k or _DEFAULT_TOP_K
+    threshold = req.threshold or _DEFAULT_THRESHOLD
+
+    # Near-duplicate queries are answered from the semantic cache, skipping retrieval and the LLM
+    cache_key = (top_k, threshold)
+    hit = semantic_cache.get(q_vec, cache_key)
+    if hit is not None:
+        answer, sources = hit
+        elapsed = int((perf_counter() - t0) * 1000)
+        await _record_history(req, answer, sources, elapsed)
+        return ORJSONResponse(ChatResponse(answer=answer, sources=sources, processing_time_ms=elapsed).model_dump(mode="json"))
+
+    rows = await fetch_ann(_RETRIEVE_SQL, q_vec, threshold, top_k, ef_search=top_k * 4)
+
     if not rows:
         raise HTTPException(status_code=404, detail="No relevant context found for the query.")
 
-    sources: List[Source] = []
-    context_snippets: List[str] = []
-    for r in rows:
-        sources.append(Source(id=str(r["chunk_id"]), score=float(r["similarity"])) )
-        context_snippets.append(r["content"]) 
+    sources = [Source(id=str(r["chunk_id"]), score=float(r["similarity"])) for r in rows]
+    messages = _build_messages(req.query, rows)
 
-    system_prompt = (
-        "You are an assistant that answers questions strictly using the provided context. "
-        "Cite relevant parts concisely. If the answer is not in the context, say you don't know."
-    )
-    context_text = "\n\n".join(context_snippets)
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Context:\n{context_text}\n\nQuestion: {req.query}"},
-    ]
+    api_key = _openrouter_api_key(settings)
 
-    api_key = (
-        get_settings().__dict__.get("OPENROUTER_API_KEY")
-        or get_settings().__dict__.get("HORIZON_ALPHA_API_KEY")
-        or get_settings().embedding_api_key
-    )
-    if not api_key:
-        raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
+    answer = await _llm_complete_openrouter(api_key, messages)
+
+    semantic_cache.put(q_vec, cache_key, (answer, sources))
+
+    elapsed = int((perf_counter() - t0) * 1000)
+    # Written before responding so a history read right after /api/chat sees this turn
+    await _record_history(req, answer, sources, elapsed)
+
+    return ORJSONResponse(ChatResponse(answer=answer, sources=sources, processing_time_ms=elapsed).model_dump(mode="json"))
+
+
+@router.post("/stream", openapi_extra=_CHAT_REQUEST_OPENAPI)
+async def chat_stream(req: ChatRequest = Depends(_chat_request), settings=Depends(get_settings)):
+
+    # Prepare context same as non-stream
+    model = get_model(settings)
+    q_vec = await embed_query(model, req.query)
+    top_k = req.top_k or _DEFAULT_TOP_K
+    threshold = req.threshold or _DEFAULT_THRESHOLD
+    rows = await fetch_ann(_RETRIEVE_SQL, q_vec, threshold, top_k, ef_search=top_k * 4)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No relevant context found for the query.")
+
+    sources = [Source(id=str(r["chunk_id"]), score=float(r["similarity"])) for r in rows]
+    messages = _build_messages(req.query, rows)
+
+    api_key = _openrouter_api_key(settings)
 
     async def event_stream() -> AsyncGenerator[bytes, None]:
-        base_url = "https://openrouter.ai/api/v1"
-        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-        payload = {"model": "qwen/qwen3-coder:free", "messages": messages, "stream": True}
+        payload = {"model": _LLM_MODEL, "messages": messages, "stream": True}
         full_text: List[str] = []
         start = perf_counter()
-        async with httpx.AsyncClient(timeout=None, base_url=base_url) as client:
-            async with client.stream("POST", "/chat/completions", json=payload, headers=headers) as resp:
-                if resp.status_code >= 400:
-                    txt = await resp.aread()
-                    yield f"event: error\ndata: {txt.decode()}\n\n".encode()
-                    return
-                async for line in resp.aiter_lines():
-                    if not line or not line.startswith("data:"):
-                        continue
-                    data = line[5:].strip()
-                    if data == "[DONE]":
+        # Coalesce the deltas that arrive in one network read into one write (capped at
+        # _FLUSH_TOKENS), instead of one write per token. Nothing is held across a read,
+        # so an upstream stall never delays text already received; the client just
+        # concatenates the text.
+        pending: List[str] = []
+        async with _get_http().stream("POST", "/chat/completions", content=orjson.dumps(payload), headers=_auth_headers(api_key), timeout=None) as resp:
+            if resp.status_code >= 400:
+                txt = await resp.aread()
+                yield f"event: error\ndata: {txt.decode()}\n\n".encode()
+                return
+            done = False
+            async for batch in _iter_sse_data(resp.aiter_bytes(8192)):
+                for data in batch:
+                    if data == b"[DONE]":
+                        done = True
                         break
                     try:
-                        obj = json.loads(data)
+                        obj = orjson.loads(data)
                         delta = obj.get("choices", [{}])[0].get("delta", {})
                         content = delta.get("content")
-                        if content:
-                            full_text.append(content)
-                            yield content.encode()
                     except Exception:
                         continue
+                    if content:
+                        full_text.append(content)
+                        pending.append(content)
+                        if len(pending) >= _FLUSH_TOKENS:
+                            yield "".join(pending).encode()
+                            pending.clear()
+                if pending:
+                    yield "".join(pending).encode()
+                    pending.clear()
+                if done:
+                    break
         # store history at end
         elapsed = int((perf_counter() - start) * 1000)
-        try:
-            await execute(
-                """
-                INSERT INTO chat_history (session_id, user_message, assistant_message, source_documents, processing_time_ms)
-                VALUES ($1, $2, $3, $4::jsonb, $5)
-                """,
-                req.session_id or "anonymous",
-                req.query,
-                "".join(full_text),
-                json.dumps([s.dict() for s in sources]),
-                elapsed,
-            )
-        except Exception as e:
-            logger.warning("Failed to store streamed chat history: {}", e)
+        await _store_history(req, "".join(full_text), sources, elapsed)
 
     return StreamingResponse(event_stream(), media_type="text/plain")
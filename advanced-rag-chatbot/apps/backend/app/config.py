@@ -27,8 +27,38 @@ class Settings(BaseModel):
 
     vector_db_url: str | None = os.getenv("VECTOR_DB_URL")
     database_url: str | None = os.getenv("DATABASE_URL")
+    # Keep db_pool_max_size below Postgres max_connections minus headroom for other clients
+    db_pool_min_size: int = Field(default=int(os.getenv("DB_POOL_MIN_SIZE", 5)))
+    db_pool_max_size: int = Field(default=int(os.getenv("DB_POOL_MAX_SIZE", 25)))
+    db_pool_max_inactive_lifetime: float = Field(default=float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300.0)))
+    db_pool_max_queries: int = Field(default=int(os.getenv("DB_POOL_MAX_QUERIES", 50000)))
+    db_statement_cache_size: int = Field(default=int(os.getenv("DB_STATEMENT_CACHE_SIZE", 1024)))
     embedding_api_url: str | None = os.getenv("EMBEDDING_API_URL")
     embedding_api_key: str | None = os.getenv("OPENROUTER_API_KEY")
+    # Directory with an exported (optionally int8-quantized) ONNX model + tokenizer
+    embedding_onnx_dir: str | None = os.getenv("EMBEDDING_ONNX_DIR")
+    # PyTorch encoder only: bf16 weights (AVX-512 BF16 / AMX CPUs) and torch.compile
+    embedding_bf16: bool = Field(default=os.getenv("EMBEDDING_BF16", "0") == "1")
+    embedding_torch_compile: bool = Field(default=os.getenv("EMBEDDING_TORCH_COMPILE", "0") == "1")
+    # Chat answers reused for near-duplicate questions (cosine >= threshold); 0 disables.
+    # Document changes clear it in the current process only, so enable with a single worker
+    semantic_cache_size: int = Field(default=int(os.getenv("SEMANTIC_CACHE_SIZE", 0)))
+    semantic_cache_threshold: float = Field(default=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97)))
+    # Threads running encode(); torch/ORT intra-op threads are split evenly between them
+    encode_workers: int = Field(default=int(os.getenv("ENCODE_WORKERS", 2)))
+    # Upper bound on retrieved context characters sent to the LLM per question
+    context_max_chars: int = Field(default=int(os.getenv("CONTEXT_MAX_CHARS", 12000)))
+    # /api/stats serves cached counts for this many seconds
+    stats_cache_ttl: float = Field(default=float(os.getenv("STATS_CACHE_TTL", 5.0)))
+    # Connection-level HNSW candidate list size; larger queries raise it per transaction
+    hnsw_ef_search: int = Field(default=int(os.getenv("HNSW_EF_SEARCH", 40)))
+    # Seconds a cached chat-history page is served before re-reading Postgres. The cache is
+    # per process and only invalidated locally, so other workers may lag by up to this long
+    history_cache_ttl: float = Field(default=float(os.getenv("HISTORY_CACHE_TTL", 2.0)))
+    # Query text -> embedding LRU entries kept in process
+    query_embedding_cache_size: int = Field(default=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096)))
+    # Texts per encoder batch when generating embeddings for stored chunks
+    batch_size: int = Field(default=int(os.getenv("BATCH_SIZE", 64)))
 
 
 @lru_cache
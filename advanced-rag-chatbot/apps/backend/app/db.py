@@ -1,12 +1,33 @@
 import asyncio
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Sequence
 import asyncpg
+import orjson
 from loguru import logger
+from pgvector.asyncpg import register_vector
 from .config import get_settings
 
 _pool: Optional[asyncpg.pool.Pool] = None
 
 
+_EF_SEARCH = get_settings().hnsw_ef_search
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # Binary pgvector codec: vectors travel as packed float32 instead of text literals.
+    # The extension must exist before the codec can resolve the type.
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    await register_vector(conn)
+    # jsonb in and out as Python objects via orjson; the binary format is a
+    # version byte (1) followed by the JSON text
+    await conn.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=lambda v: b"\x01" + orjson.dumps(v),
+        decoder=lambda b: orjson.loads(b[1:]),
+        format="binary",
+    )
+
+
 async def get_pool() -> asyncpg.pool.Pool:
     global _pool
     if _pool is None:
@@ -20,7 +41,20 @@ async def get_pool() -> asyncpg.pool.Pool:
         if not db_url:
             raise RuntimeError("DATABASE_URL / VECTOR_DB_URL not configured")
         logger.info("Initializing Postgres connection pool")
-        _pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=10)
+        _pool = await asyncpg.create_pool(
+            dsn=db_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            max_inactive_connection_lifetime=settings.db_pool_max_inactive_lifetime,
+            max_queries=settings.db_pool_max_queries,
+            # conn.fetch/execute go through this per-connection cache, so hot queries
+            # are prepared once per connection rather than re-parsed per call
+            statement_cache_size=settings.db_statement_cache_size,
+            # Sent as a startup parameter so it survives the RESET ALL asyncpg runs
+            # when a connection is released back to the pool
+            server_settings={"hnsw.ef_search": str(_EF_SEARCH)},
+            init=_init_connection,
+        )
     return _pool
 
 
@@ -68,15 +102,31 @@ CREATE TABLE IF NOT EXISTS chunks (
 CREATE TABLE IF NOT EXISTS embeddings (
   id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
   chunk_id UUID REFERENCES chunks(id) ON DELETE CASCADE,
-  embedding vector(768) NOT NULL,
+  embedding halfvec(768) NOT NULL,
   model_version TEXT DEFAULT 'all-mpnet-base-v2',
   created_at TIMESTAMPTZ DEFAULT NOW(),
   UNIQUE(chunk_id)
 );
 
--- Vector index tuned for cosine similarity
-CREATE INDEX IF NOT EXISTS embeddings_vec_cos_idx
-  ON embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- HNSW inner-product index; embeddings are unit length so this ranks by cosine
+-- (replaces the earlier ivfflat cosine index)
+DROP INDEX IF EXISTS embeddings_vec_cos_idx;
+
+-- Embeddings are stored as FP16 halfvec (half the bytes per vector); convert
+-- tables created with vector(768), rebuilding the index afterwards
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+    WHERE a.attrelid = 'embeddings'::regclass AND a.attname = 'embedding' AND t.typname = 'vector'
+  ) THEN
+    DROP INDEX IF EXISTS embeddings_vec_ip_idx;
+    ALTER TABLE embeddings ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768);
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS embeddings_vec_ip_idx
+  ON embeddings USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
 
 CREATE TABLE IF NOT EXISTS chat_history (
   id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -90,8 +140,14 @@ CREATE TABLE IF NOT EXISTS chat_history (
 
 -- Helpful indexes
 CREATE INDEX IF NOT EXISTS sessions_last_activity_idx ON sessions(last_activity);
-CREATE INDEX IF NOT EXISTS chat_history_session_idx ON chat_history(session_id);
+-- Embedding generation reuses vectors of chunks with identical content
+CREATE INDEX IF NOT EXISTS chunks_content_hash_idx ON chunks(content_hash);
 CREATE INDEX IF NOT EXISTS chat_history_created_at_idx ON chat_history(created_at DESC);
+-- History and document listings filter by session and order by recency
+-- (id is the keyset-pagination tiebreaker)
+DROP INDEX IF EXISTS chat_history_session_idx;
+CREATE INDEX IF NOT EXISTS chat_history_session_created_id_idx ON chat_history(session_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_session_created_idx ON documents(session_id, created_at DESC);
 
 -- Optional utility functions
 CREATE OR REPLACE FUNCTION cleanup_expired_sessions(max_age interval DEFAULT interval '1 hour')
@@ -117,15 +173,27 @@ $$ LANGUAGE plpgsql;
 """
 
 
+_schema_ready = False
+_schema_lock = asyncio.Lock()
+
+
 async def ensure_schema() -> None:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        try:
-            await conn.execute(SCHEMA_SQL)
-            logger.info("Database schema ensured (tables present)")
-        except Exception as exc:
-            logger.exception("Failed ensuring schema: {}", exc)
-            raise
+    # Runs SCHEMA_SQL once per process (at startup); later calls return immediately
+    global _schema_ready
+    if _schema_ready:
+        return
+    async with _schema_lock:
+        if _schema_ready:
+            return
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            try:
+                await conn.execute(SCHEMA_SQL)
+                logger.info("Database schema ensured (tables present)")
+            except Exception as exc:
+                logger.exception("Failed ensuring schema: {}", exc)
+                raise
+        _schema_ready = True
 
 
 async def fetchval(query: str, *args: Any) -> Any:
@@ -140,8 +208,29 @@ async def execute(query: str, *args: Any) -> str:
         return await conn.execute(query, *args)
 
 
+async def executemany(query: str, args: Iterable[Sequence[Any]]) -> None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.executemany(query, args)
+
+
 async def fetch(query: str, *args: Any) -> list[asyncpg.Record]:
     pool = await get_pool()
     async with pool.acquire() as conn:
         rows = await conn.fetch(query, *args)
         return rows
+
+
+async def fetch_ann(query: str, *args: Any, ef_search: int) -> list[asyncpg.Record]:
+    # An HNSW scan returns at most ef_search rows, so queries asking for more raise it for
+    # their own transaction only; everything else keeps the cheaper connection default,
+    # which is the pool's hnsw.ef_search startup parameter and so survives release resets
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        ef_search = min(int(ef_search), 1000)
+        if ef_search <= _EF_SEARCH:
+            return await conn.fetch(query, *args)
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+            return await conn.fetch(query, *args)
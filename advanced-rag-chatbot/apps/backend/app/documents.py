@@ -1,20 +1,29 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from fastapi import BackgroundTasks
 from typing import List
 from loguru import logger
-import pdfplumber
+import fitz  # PyMuPDF
 from PyPDF2 import PdfReader
 import hashlib
 import io
 from .config import get_settings
-from .db import ensure_schema, execute, fetchval, fetch
+from .db import execute, executemany, fetchval, fetch
 from .schemas import DocumentsResponse, DocumentInfo
+from .semantic_cache import semantic_cache
+
+try:
+    from blake3 import blake3 as _HASHER
+except ImportError:  # wheels are missing on some platforms; both give 64 hex chars
+    _HASHER = hashlib.sha256
+
 
 router = APIRouter(prefix="/api/documents", tags=["documents"]) 
 
 
 def _hash_text(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # Dedupe key only, not a security boundary
+    return _HASHER(text.encode("utf-8")).hexdigest()
 
 
 def _split_chunks(text: str, chunk_size: int, overlap: int) -> List[str]:
@@ -31,12 +40,9 @@ def _split_chunks(text: str, chunk_size: int, overlap: int) -> List[str]:
     return chunks
 
 
-def _extract_text_pdfplumber(file_bytes: bytes) -> tuple[str, int]:
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        pages_text = []
-        for page in pdf.pages:
-            pages_text.append(page.extract_text() or "")
-        return "\n".join(pages_text), len(pdf.pages)
+def _extract_text_pymupdf(file_bytes: bytes) -> tuple[str, int]:
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        return "\n".join(page.get_text("text") for page in doc), doc.page_count
 
 
 def _extract_text_pypdf2(file_bytes: bytes) -> tuple[str, int]:
@@ -47,9 +53,17 @@ def _extract_text_pypdf2(file_bytes: bytes) -> tuple[str, int]:
     return "\n".join(pages_text), len(reader.pages)
 
 
+def _extract_text(file_bytes: bytes) -> tuple[str, int]:
+    # PyMuPDF first; PyPDF2 only as a fallback for parse errors
+    try:
+        return _extract_text_pymupdf(file_bytes)
+    except Exception as e:
+        logger.warning("PyMuPDF failed: {}", e)
+        return _extract_text_pypdf2(file_bytes)
+
+
 @router.get("", response_model=DocumentsResponse)
 async def list_documents(session_id: str | None = None):
-    await ensure_schema()
     rows = await fetch(
         """
         SELECT d.id, d.filename, d.file_size, d.total_pages,
@@ -75,9 +89,9 @@ async def list_documents(session_id: str | None = None):
 
 @router.delete("/{document_id}")
 async def delete_document(document_id: str):
-    await ensure_schema()
     # delete cascades to chunks and embeddings per FK
     await execute("DELETE FROM documents WHERE id = $1", document_id)
+    semantic_cache.clear()
     return {"status": "ok"}
 
 
@@ -106,27 +120,18 @@ async def upload_documents(
     if total_size > max_total_bytes:
         raise HTTPException(status_code=400, detail="Total upload size exceeds limit")
 
-    await ensure_schema()
 
-    stored_docs = []
-    for f in files:
-        file_bytes = await f.read()
-
-        # Extract text using preferred pipeline with fallback
-        text = ""
-        pages = 0
-        try:
-            text, pages = _extract_text_pdfplumber(file_bytes)
-            if not text.strip():
-                raise ValueError("Empty text via pdfplumber, fallback")
-        except Exception as e:
-            logger.warning("pdfplumber failed: {}", e)
-            try:
-                text, pages = _extract_text_pypdf2(file_bytes)
-            except Exception as e2:
-                logger.error("PyPDF2 failed: {}", e2)
-                raise HTTPException(status_code=422, detail="Failed to process PDF. It may be corrupted.")
+    payloads = [await f.read() for f in files]
 
+    # Extract all PDFs concurrently off the event loop
+    try:
+        extractions = await asyncio.gather(*(asyncio.to_thread(_extract_text, b) for b in payloads))
+    except Exception as e:
+        logger.error("PyPDF2 failed: {}", e)
+        raise HTTPException(status_code=422, detail="Failed to process PDF. It may be corrupted.")
+
+    stored_docs = []
+    for f, file_bytes, (text, pages) in zip(files, payloads, extractions):
         # Store document row
         doc_id = await fetchval(
             """
@@ -139,20 +144,16 @@ async def upload_documents(
             pages,
         )
 
-        # Chunk and store chunks
+        # Chunk and store chunks in one batched round trip
         chunks = _split_chunks(text, chunk_size, overlap)
-        for idx, chunk in enumerate(chunks):
-            await execute(
-                """
-                INSERT INTO chunks (document_id, chunk_index, content, content_hash)
-                VALUES ($1, $2, $3, $4)
-                ON CONFLICT (document_id, chunk_index) DO NOTHING
-                """,
-                doc_id,
-                idx,
-                chunk,
-                _hash_text(chunk),
-            )
+        await executemany(
+            """
+            INSERT INTO chunks (document_id, chunk_index, content, content_hash)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (document_id, chunk_index) DO NOTHING
+            """,
+            [(doc_id, idx, chunk, _hash_text(chunk)) for idx, chunk in enumerate(chunks)],
+        )
 
         stored_docs.append({
             "id": str(doc_id),
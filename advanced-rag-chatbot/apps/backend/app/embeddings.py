@@ -1,45 +1,92 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from typing import Any, List
 from loguru import logger
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import torch
 from .config import get_settings
-from .db import fetch, execute, ensure_schema
+from .db import fetch, executemany
+from .onnx_encoder import OnnxEncoder
+from .semantic_cache import semantic_cache
 
 router = APIRouter(prefix="/api/embeddings", tags=["embeddings"]) 
 
-_model: SentenceTransformer | None = None
+_model: SentenceTransformer | OnnxEncoder | None = None
 
+# encode() is CPU-bound and synchronous; run it on dedicated workers so it never
+# blocks the event loop. Split the cores between workers to avoid oversubscription.
+_encode_workers = max(1, get_settings().encode_workers)
+_encode_threads = max(1, (os.cpu_count() or 1) // _encode_workers)
+_encode_pool = ThreadPoolExecutor(max_workers=_encode_workers, thread_name_prefix="encode")
+torch.set_num_threads(_encode_threads)
 
-def get_model(settings) -> SentenceTransformer:
+
+def get_model(settings) -> SentenceTransformer | OnnxEncoder:
     global _model
     if _model is None:
-        model_name = getattr(settings, "EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
-        logger.info("Loading embedding model: {}", model_name)
-        _model = SentenceTransformer(model_name)
+        if settings.embedding_onnx_dir:
+            _model = OnnxEncoder(settings.embedding_onnx_dir, threads=_encode_threads)
+        else:
+            model_name = getattr(settings, "EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+            logger.info("Loading embedding model: {}", model_name)
+            _model = SentenceTransformer(model_name)
+            _model.eval()
+            if settings.embedding_bf16:
+                # encode() upcasts bf16 outputs to float32 before returning numpy
+                _model = _model.to(torch.bfloat16)
+            if settings.embedding_torch_compile:
+                # Compile the transformer module; padded batch shapes vary, hence dynamic
+                _model[0].auto_model = torch.compile(_model[0].auto_model, dynamic=True)
     return _model
 
 
-def _as_pgvector(vec: List[float]) -> str:
-    return "[" + ",".join(f"{v:.8f}" for v in vec) + "]"
+async def encode_async(model: SentenceTransformer | OnnxEncoder, texts: List[str], **kwargs: Any) -> np.ndarray:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_encode_pool, partial(model.encode, texts, **kwargs))
+
+
+# Repeated queries skip the forward pass: query text -> unit-length float32 vector (LRU)
+_query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_QUERY_CACHE_MAX = get_settings().query_embedding_cache_size
 
 
-async def _embed_texts(model: SentenceTransformer, texts: List[str], batch_size: int = 16) -> List[List[float]]:
+async def embed_query(model: SentenceTransformer | OnnxEncoder, text: str) -> np.ndarray:
+    vec = _query_cache.get(text)
+    if vec is not None:
+        _query_cache.move_to_end(text)
+        return vec
+    vec = (await encode_async(model, [text], convert_to_numpy=True, normalize_embeddings=True))[0].astype(np.float32, copy=False)
+    vec.setflags(write=False)  # shared between requests
+    _query_cache[text] = vec
+    if len(_query_cache) > _QUERY_CACHE_MAX:
+        _query_cache.popitem(last=False)
+    return vec
+
+
+async def _embed_texts(model: SentenceTransformer | OnnxEncoder, texts: List[str], batch_size: int = 64) -> np.ndarray:
     if not texts:
-        return []
-    emb = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
-    return emb.tolist()
+        return np.empty((0, 0), dtype=np.float32)
+    # Smart batching: neighbours of similar length pad to similar sizes
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    emb = await encode_async(model, [texts[i] for i in order], batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
+    out = np.empty_like(emb, dtype=np.float32)
+    out[order] = emb
+    return out
 
 
 @router.post("/generate")
 async def generate_all_missing(settings=Depends(get_settings)):
-    await ensure_schema()
     model = get_model(settings)
 
     # Find chunks without embeddings
     rows = await fetch(
         """
-        SELECT c.id, c.content
+        SELECT c.id, c.content, c.content_hash
         FROM chunks c
         LEFT JOIN embeddings e ON e.chunk_id = c.id
         WHERE e.id IS NULL
@@ -51,24 +98,38 @@ async def generate_all_missing(settings=Depends(get_settings)):
     if not rows:
         return {"status": "ok", "generated": 0}
 
-    texts = [r["content"] for r in rows]
-    ids = [r["id"] for r in rows]
-
-    vectors = await _embed_texts(model, texts, batch_size=int(getattr(settings, "BATCH_SIZE", 16)))
-
-    # Insert embeddings
-    created = 0
-    for chunk_id, vec in zip(ids, vectors):
-        await execute(
-            """
-            INSERT INTO embeddings (chunk_id, embedding, model_version)
-            VALUES ($1, $2::vector, $3)
-            ON CONFLICT (chunk_id) DO NOTHING
-            """,
-            chunk_id,
-            _as_pgvector(vec),
-            getattr(settings, "EMBEDDING_MODEL", "all-mpnet-base-v2"),
-        )
-        created += 1
-
-    return {"status": "ok", "generated": created}
+    # Identical content (same hash) gets the same vector: reuse embeddings already
+    # stored for that hash and encode each remaining distinct text once. Stored vectors
+    # come back as pgvector HalfVector objects, which the halfvec codec re-encodes as-is.
+    hashes = list({r["content_hash"] for r in rows})
+    known = await fetch(
+        """
+        SELECT DISTINCT ON (c.content_hash) c.content_hash, e.embedding
+        FROM chunks c
+        JOIN embeddings e ON e.chunk_id = c.id
+        WHERE c.content_hash = ANY($1::text[])
+        """,
+        hashes,
+    )
+    by_hash = {r["content_hash"]: r["embedding"] for r in known}
+    to_encode = {}
+    for r in rows:
+        if r["content_hash"] not in by_hash:
+            to_encode.setdefault(r["content_hash"], r["content"])
+    if to_encode:
+        vectors = await _embed_texts(model, list(to_encode.values()), batch_size=settings.batch_size)
+        by_hash.update(zip(to_encode.keys(), vectors))
+
+    # Insert embeddings in a single batched round trip
+    model_version = getattr(settings, "EMBEDDING_MODEL", "all-mpnet-base-v2")
+    await executemany(
+        """
+        INSERT INTO embeddings (chunk_id, embedding, model_version)
+        VALUES ($1, $2::halfvec, $3)
+        ON CONFLICT (chunk_id) DO NOTHING
+        """,
+        [(r["id"], by_hash[r["content_hash"]], model_version) for r in rows],
+    )
+    semantic_cache.clear()
+
+    return {"status": "ok", "generated": len(rows), "encoded": len(to_encode)}
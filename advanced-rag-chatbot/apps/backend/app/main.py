@@ -1,14 +1,20 @@
+from contextlib import asynccontextmanager
+from time import monotonic
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from loguru import logger
 from .config import get_settings
 from .documents import router as documents_router
-from .embeddings import router as embeddings_router
-from .chat import router as chat_router
+from .embeddings import router as embeddings_router, get_model, encode_async
+from .chat import router as chat_router, close_http
 from .sessions import router as sessions_router
-from .db import get_pool, close_pool, fetch
+from .db import ensure_schema, close_pool, fetch
 from .schemas import StatsResponse
 
+# /api/stats runs unfiltered COUNT(*)s (a full scan each); serve a short-lived copy
+_stats_cache: tuple[float, StatsResponse] | None = None
+
 
 def create_app() -> FastAPI:
     settings = get_settings()
@@ -17,7 +23,24 @@ def create_app() -> FastAPI:
     logger.remove()
     logger.add(lambda msg: print(msg, end=""))
 
-    app = FastAPI(title="Advanced RAG Chatbot Backend", version="0.1.0")
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Creates the pool and applies the schema once, instead of on every request
+        await ensure_schema()
+        # Load the embedding model and run one encode so the first chat request
+        # does not pay for model load and graph initialization
+        model = get_model(settings)
+        await encode_async(model, ["warmup"])
+        yield
+        await close_http()
+        await close_pool()
+
+    app = FastAPI(
+        title="Advanced RAG Chatbot Backend",
+        version="0.1.0",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
+    )
 
     # CORS
     app.add_middleware(
@@ -32,8 +55,14 @@ def create_app() -> FastAPI:
     async def health():
         return {"status": "healthy"}
 
+    stats_ttl = settings.stats_cache_ttl
+
     @app.get("/api/stats", response_model=StatsResponse)
     async def stats():
+        # Counts may lag writes by up to STATS_CACHE_TTL seconds
+        global _stats_cache
+        if _stats_cache is not None and monotonic() - _stats_cache[0] < stats_ttl:
+            return _stats_cache[1]
         rows = await fetch(
             """
             SELECT
@@ -45,13 +74,15 @@ def create_app() -> FastAPI:
             """
         )
         r = rows[0]
-        return StatsResponse(
+        result = StatsResponse(
             total_documents=r["total_documents"],
             total_chunks=r["total_chunks"],
             total_embeddings=r["total_embeddings"],
             total_sessions=r["total_sessions"],
             total_messages=r["total_messages"],
         )
+        _stats_cache = (monotonic(), result)
+        return result
 
     # Routers
     app.include_router(documents_router)
@@ -59,13 +90,4 @@ def create_app() -> FastAPI:
     app.include_router(chat_router)
     app.include_router(sessions_router)
 
-    @app.on_event("startup")
-    async def _on_startup():
-        await get_pool()
-
-    @app.on_event("shutdown")
-    async def _on_shutdown():
-        await close_pool()
-
     return app
-
@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+from typing import List
+import numpy as np
+import onnxruntime as ort
+from loguru import logger
+from transformers import AutoTokenizer
+
+
+class OnnxEncoder:
+    """ONNX Runtime replacement for the subset of SentenceTransformer.encode the app uses."""
+
+    def __init__(self, model_dir: str, max_seq_length: int = 384, threads: int | None = None):
+        path = Path(model_dir)
+        model_file = path / "model_quantized.onnx"
+        if not model_file.is_file():
+            model_file = path / "model.onnx"
+        logger.info("Loading ONNX embedding model: {}", model_file)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads or os.cpu_count() or 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(str(model_file), opts, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = AutoTokenizer.from_pretrained(str(path))
+        self.max_seq_length = max_seq_length
+
+    def encode(
+        self,
+        sentences: str | List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out: List[np.ndarray] = []
+        for start in range(0, len(texts), batch_size):
+            enc = self._tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            token_emb = self._session.run(None, feeds)[0]  # (batch, tokens, dim)
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_emb * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32, copy=False))
+        emb = np.vstack(out) if out else np.empty((0, 0), dtype=np.float32)
+        return emb[0] if single else emb
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True) -> Path:
+    """Export a SentenceTransformer checkpoint to ONNX (plus int8 weights) for OnnxEncoder."""
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as exc:
+        raise RuntimeError("ONNX export needs optimum: pip install 'optimum[onnxruntime]'") from exc
+
+    path = Path(out_dir)
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True, provider="CPUExecutionProvider")
+    model.save_pretrained(path)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+    if quantize:
+        # Dynamic int8 with VNNI kernels; writes model_quantized.onnx next to model.onnx
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(model).quantize(save_dir=path, quantization_config=qconfig)
+    logger.info("Exported ONNX embedding model to {}", path)
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+
+    export_onnx(sys.argv[1], sys.argv[2])
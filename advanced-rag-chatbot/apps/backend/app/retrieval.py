@@ -1,24 +1,62 @@
+import asyncio
+from typing import Literal
+from collections import OrderedDict
 from fastapi import APIRouter, Query, Depends
-from typing import List, Tuple
-from .db import fetch
+import numpy as np
+from .db import fetch_ann
 from .config import get_settings
+from .embeddings import get_model, embed_query
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
-router = APIRouter(prefix="/api/search", tags=["search"]) 
+router = APIRouter(prefix="/api/search", tags=["search"])
 
+# Dense candidates re-scored by the hybrid ranker (raised to top_k when that is larger)
+_HYBRID_CANDIDATES = 200
 
-def _overlap_score(query: str, text: str) -> float:
-    q_tokens = set(query.lower().split())
-    t_tokens = set(text.lower().split())
+
+# Chunk content is immutable per id, so token sets are cached by chunk id (bounded LRU)
+_chunk_tokens: "OrderedDict[str, frozenset[str]]" = OrderedDict()
+_CHUNK_TOKENS_MAX = 10_000
+
+
+def _chunk_token_set(chunk_id: str, text: str) -> frozenset[str]:
+    tokens = _chunk_tokens.get(chunk_id)
+    if tokens is None:
+        tokens = frozenset(text.lower().split())
+        _chunk_tokens[chunk_id] = tokens
+        if len(_chunk_tokens) > _CHUNK_TOKENS_MAX:
+            _chunk_tokens.popitem(last=False)
+    else:
+        _chunk_tokens.move_to_end(chunk_id)
+    return tokens
+
+
+def _overlap_score(q_tokens: set[str], t_tokens: frozenset[str]) -> float:
     if not q_tokens or not t_tokens:
         return 0.0
-    return len(q_tokens & t_tokens) / max(1, len(q_tokens))
+    return len(q_tokens & t_tokens) / len(q_tokens)
+
+
+def _tfidf_scores(q: str, texts: list[str]) -> np.ndarray:
+    # Fitting the vectorizer is CPU-bound (tens of ms for a full candidate pool)
+    vectorizer = TfidfVectorizer(stop_words='english')
+    tfidf_matrix = vectorizer.fit_transform(texts + [q])
+    query_vec = tfidf_matrix[-1]
+    doc_matrix = tfidf_matrix[:-1]
+    # rows are L2-normalized, so the dot product is the cosine
+    return (query_vec @ doc_matrix.T).toarray()[0]  # shape: (K,)
 
 
-async def _fetch_corpus() -> List[Tuple[str, str]]:
-    rows = await fetch("SELECT id, content FROM chunks")
-    return [(str(r['id']), r['content']) for r in rows]
+def _fuse_scores(signals: list[np.ndarray], weights: list[float], fusion: str = "weighted") -> np.ndarray:
+    # "minmax" rescales each signal to [0, 1] over the candidate pool before weighting,
+    # so the weights are not skewed by the signals' different native ranges
+    scores = np.zeros_like(signals[0], dtype=np.float32)
+    for s, w in zip(signals, weights):
+        if fusion == "minmax":
+            lo = s.min()
+            s = (s - lo) / (s.max() - lo + 1e-9)
+        scores += w * s
+    return scores
 
 
 @router.get("/hybrid")
@@ -28,36 +66,55 @@ async def hybrid_search(
     dense_weight: float = Query(0.4, ge=0.0, le=1.0),
     tfidf_weight: float = Query(0.3, ge=0.0, le=1.0),
     overlap_weight: float = Query(0.3, ge=0.0, le=1.0),
+    fusion: Literal["weighted", "minmax"] = Query("weighted"),
     settings=Depends(get_settings),
 ):
-    # 1) Get corpus
-    corpus = await _fetch_corpus()  # [(chunk_id, content)]
-    if not corpus:
+    # 1) Dense candidate pool ranked by pgvector; only these rows cross the wire
+    q_emb = await embed_query(get_model(settings), q)
+    pool_size = max(top_k, _HYBRID_CANDIDATES)
+    rows = await fetch_ann(
+        """
+        SELECT c.id AS chunk_id, c.content,
+               -(e.embedding <#> $1::halfvec) AS dense
+        FROM embeddings e
+        JOIN chunks c ON c.id = e.chunk_id
+        ORDER BY e.embedding <#> $1::halfvec ASC
+        LIMIT $2
+        """,
+        q_emb,
+        pool_size,
+        ef_search=pool_size,
+    )
+    if not rows:
         return {"results": []}
 
-    ids = [cid for cid, _ in corpus]
-    texts = [t for _, t in corpus]
+    ids = [str(r["chunk_id"]) for r in rows]
+    texts = [r["content"] for r in rows]
+    dense_scores = np.array([r["dense"] for r in rows], dtype=np.float32)
 
-    # 2) TF-IDF + cosine
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(texts + [q])
-    query_vec = tfidf_matrix[-1]
-    doc_matrix = tfidf_matrix[:-1]
-    sparse_scores = cosine_similarity(query_vec, doc_matrix)[0]  # shape: (N,)
+    # 2) TF-IDF + cosine over the candidates only, off the event loop
+    sparse_scores = await asyncio.to_thread(_tfidf_scores, q, texts)
 
     # 3) Overlap score
-    overlap_scores = [ _overlap_score(q, t) for t in texts ]
-
-    # 4) Dense score (optional quick proxy: reuse sparse for now since dense embedding of all chunks on each request is expensive)
-    # In production, consider precomputing embeddings of all chunks to avoid real-time encoding.
-    # Here we'll reuse sparse_scores as a proxy to keep endpoint responsive.
-    dense_scores = sparse_scores
+    q_tokens = set(q.lower().split())
+    overlap_scores = np.array(
+        [_overlap_score(q_tokens, _chunk_token_set(cid, t)) for cid, t in zip(ids, texts)],
+        dtype=np.float32,
+    )
 
-    # 5) Combine
-    results = []
-    for i, cid in enumerate(ids):
-        score = dense_weight * float(dense_scores[i]) + tfidf_weight * float(sparse_scores[i]) + overlap_weight * float(overlap_scores[i])
-        results.append({"chunk_id": cid, "content": texts[i], "score": score})
-    results.sort(key=lambda x: x["score"], reverse=True)
+    # 4) Combine
+    scores = _fuse_scores(
+        [dense_scores, sparse_scores, overlap_scores],
+        [dense_weight, tfidf_weight, overlap_weight],
+        fusion,
+    )
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
 
-    return {"results": results[:top_k]}
+    return {
+        "results": [
+            {"chunk_id": ids[i], "content": texts[i], "score": float(scores[i])}
+            for i in top
+        ]
+    }
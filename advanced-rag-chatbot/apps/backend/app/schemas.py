@@ -1,12 +1,15 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Any
+from pydantic import BaseModel
+from typing import Annotated, List, Optional, Any
+import msgspec
+from msgspec import Meta
 
 
-class ChatRequest(BaseModel):
-    query: str = Field(..., min_length=1)
+# Decoded and validated by msgspec on the hot chat path (see chat._chat_request)
+class ChatRequest(msgspec.Struct, frozen=True):
+    query: Annotated[str, Meta(min_length=1)]
     session_id: Optional[str] = None
-    top_k: Optional[int] = Field(default=5, ge=1, le=50)
-    threshold: Optional[float] = Field(default=0.0, ge=0.0, le=1.0)
+    top_k: Optional[Annotated[int, Meta(ge=1, le=50)]] = 5
+    threshold: Optional[Annotated[float, Meta(ge=0.0, le=1.0)]] = 0.0
 
 
 class Source(BaseModel):
@@ -32,6 +35,8 @@ class ChatHistoryItem(BaseModel):
 
 class ChatHistoryResponse(BaseModel):
     messages: List[ChatHistoryItem]
+    # Pass back as ?cursor= to fetch the next (older) page; None on the last page
+    next_cursor: Optional[str] = None
 
 
 class DocumentInfo(BaseModel):
@@ -0,0 +1,62 @@
+from typing import Any, Hashable, List
+import numpy as np
+from .config import get_settings
+
+
+class SemanticCache:
+    """Bounded LRU cache keyed by unit-length query embeddings.
+
+    A lookup hits when a stored embedding has cosine similarity >= threshold
+    with the query and was stored under the same key (retrieval parameters).
+    """
+
+    def __init__(self, capacity: int, threshold: float):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vecs: np.ndarray | None = None  # (capacity, dim) float32
+        self._keys: List[Hashable] = [None] * capacity
+        self._values: List[Any] = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._size = 0
+        self._tick = 0
+
+    def get(self, vec: np.ndarray, key: Hashable) -> Any | None:
+        if self._size == 0 or self._vecs is None:
+            return None
+        sims = self._vecs[:self._size] @ vec
+        hits = np.flatnonzero(sims >= self.threshold)
+        for i in hits[np.argsort(-sims[hits])]:
+            if self._keys[i] == key:
+                self._tick += 1
+                self._last_used[i] = self._tick
+                return self._values[i]
+        return None
+
+    def put(self, vec: np.ndarray, key: Hashable, value: Any) -> None:
+        if self.capacity <= 0:
+            return
+        if self._vecs is None:
+            self._vecs = np.zeros((self.capacity, vec.shape[0]), dtype=np.float32)
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+        self._tick += 1
+        self._vecs[slot] = vec
+        self._keys[slot] = key
+        self._values[slot] = value
+        self._last_used[slot] = self._tick
+
+    def clear(self) -> None:
+        self._size = 0
+        self._keys = [None] * self.capacity
+        self._values = [None] * self.capacity
+        self._last_used[:] = 0
+
+
+_settings = get_settings()
+semantic_cache = SemanticCache(
+    capacity=_settings.semantic_cache_size,
+    threshold=_settings.semantic_cache_threshold,
+)
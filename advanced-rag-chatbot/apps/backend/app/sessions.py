@@ -1,57 +1,141 @@
-from fastapi import APIRouter, Query
-from .db import fetchval, execute, fetch, ensure_schema
+import base64
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+from uuid import UUID
+from fastapi import APIRouter, HTTPException, Query, Response
+import orjson
+from .config import get_settings
+from .db import fetchval, execute, fetch
 from .schemas import ChatHistoryResponse, ChatHistoryItem, Source
-import json
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"]) 
 
 
 @router.post("")
 async def create_session():
-    await ensure_schema()
     sid = await fetchval("INSERT INTO sessions (session_id) VALUES (gen_random_uuid()::text) RETURNING session_id")
     return {"session_id": sid}
 
 
 @router.post("/refresh")
 async def refresh_session(session_id: str = Query(...)):
-    await ensure_schema()
     await execute("UPDATE sessions SET last_activity = NOW() WHERE session_id = $1", session_id)
     return {"status": "ok"}
 
 
 @router.post("/cleanup")
 async def cleanup(max_age_minutes: int = Query(60, ge=1, le=1440)):
-    await ensure_schema()
     deleted = await fetchval("SELECT cleanup_expired_sessions($1::interval)", f"{max_age_minutes} minutes")
     return {"deleted": int(deleted or 0)}
 
 
-@router.get("/history", response_model=ChatHistoryResponse)
-async def session_history(session_id: str = Query(...), limit: int = Query(50, ge=1, le=200)):
-    await ensure_schema()
-    rows = await fetch(
-        """
-        SELECT id, session_id, user_message, assistant_message, source_documents, processing_time_ms, created_at
-        FROM chat_history
-        WHERE session_id = $1
-        ORDER BY created_at DESC
-        LIMIT $2
-        """,
-        session_id,
-        limit,
-    )
+_HISTORY_SQL = """
+SELECT id, session_id, user_message, assistant_message, source_documents, processing_time_ms, created_at
+FROM chat_history
+WHERE session_id = $1
+ORDER BY created_at DESC, id DESC
+LIMIT $2
+"""
+
+# Keyset page: rows strictly older than the (created_at, id) of the previous page's last row
+_HISTORY_AFTER_SQL = """
+SELECT id, session_id, user_message, assistant_message, source_documents, processing_time_ms, created_at
+FROM chat_history
+WHERE session_id = $1 AND (created_at, id) < ($3, $4)
+ORDER BY created_at DESC, id DESC
+LIMIT $2
+"""
+
+
+def _encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), str(row_id)])).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+# Read-through cache for history pages: {session_id: {(limit, cursor): (expires_at, json_body)}}.
+# Pages are cached serialized, so a hit is served without re-encoding.
+# History only changes when a chat turn is recorded, which drops the session's entries.
+# Sessions are kept in last-write order, so with a fixed TTL the head always expires first:
+# expiry only has to look at the head, and the cap evicts the stalest session.
+_history_cache: "OrderedDict[str, dict[tuple[int, str | None], tuple[float, bytes]]]" = OrderedDict()
+_HISTORY_CACHE_TTL = get_settings().history_cache_ttl
+_HISTORY_CACHE_MAX_SESSIONS = 10_000
+# Sessions with a history load in flight: session_id -> [loads in flight, generation].
+# invalidate_history bumps the generation; a load that sees it change may have been
+# read before the new turn committed, so its page is returned but not cached.
+# Entries only live while a load is running, which keeps this bounded.
+_history_loads: dict[str, list[int]] = {}
+
+
+def invalidate_history(session_id: str) -> None:
+    _history_cache.pop(session_id, None)
+    loads = _history_loads.get(session_id)
+    if loads is not None:
+        loads[1] += 1
+
+
+def _expire_history(now: float) -> None:
+    while _history_cache:
+        pages = next(iter(_history_cache.values()))
+        if max(expires for expires, _ in pages.values()) > now:
+            break
+        _history_cache.popitem(last=False)
+
+
+def _history_response(body: bytes, cache: str) -> Response:
+    return Response(content=body, media_type="application/json", headers={"X-Cache": cache})
+
+
+async def cached_history(session_id: str, limit: int, cursor: str | None) -> Response:
+    pages = _history_cache.get(session_id)
+    hit = pages.get((limit, cursor)) if pages else None
+    if hit is not None and hit[0] > monotonic():
+        return _history_response(hit[1], "HIT")
+    loads = _history_loads.setdefault(session_id, [0, 0])
+    loads[0] += 1
+    generation = loads[1]
+    try:
+        result = await load_history(session_id, limit, cursor)
+    finally:
+        loads[0] -= 1
+        if loads[0] == 0:
+            del _history_loads[session_id]
+    body = orjson.dumps(result.model_dump(mode="json"))
+    if _HISTORY_CACHE_TTL <= 0 or loads[1] != generation:
+        return _history_response(body, "MISS")
+    now = monotonic()
+    _expire_history(now)
+    pages = _history_cache.setdefault(session_id, {})
+    pages[(limit, cursor)] = (now + _HISTORY_CACHE_TTL, body)
+    _history_cache.move_to_end(session_id)
+    if len(_history_cache) > _HISTORY_CACHE_MAX_SESSIONS:
+        _history_cache.popitem(last=False)
+    return _history_response(body, "MISS")
+
+
+async def load_history(session_id: str, limit: int, cursor: str | None = None) -> ChatHistoryResponse:
+    # Shared by /api/sessions/history and /api/chat/history: the same SQL text means both
+    # hit the same entry in asyncpg's per-connection statement cache (parsed once per connection)
+    if cursor:
+        rows = await fetch(_HISTORY_AFTER_SQL, session_id, limit, *_decode_cursor(cursor))
+    else:
+        rows = await fetch(_HISTORY_SQL, session_id, limit)
     items = []
     for r in rows:
-        src = None
-        if r["source_documents"]:
-            try:
-                src_list = r["source_documents"] if isinstance(r["source_documents"], list) else json.loads(r["source_documents"])  # type: ignore
-                src = [Source(**s) for s in src_list]
-            except Exception:
-                src = None
+        # jsonb arrives already decoded (codec registered in db._init_connection)
+        src_list = r["source_documents"]
+        src = [Source.model_construct(**s) for s in src_list] if src_list else None
+        # Rows were validated on write (trusted DB source); skip re-validation
         items.append(
-            ChatHistoryItem(
+            ChatHistoryItem.model_construct(
                 id=str(r["id"]),
                 session_id=r["session_id"],
                 user_message=r["user_message"],
@@ -61,4 +145,16 @@ async def session_history(session_id: str = Query(...), limit: int = Query(50, g
                 created_at=str(r["created_at"]),
             )
         )
-    return ChatHistoryResponse(messages=items)
+    next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return ChatHistoryResponse(messages=items, next_cursor=next_cursor)
+
+
+# Returns the page's cached JSON body directly, so FastAPI neither validates nor
+# re-encodes it; `responses=` keeps the schema in the OpenAPI docs.
+@router.get("/history", response_model=None, responses={200: {"model": ChatHistoryResponse}})
+async def session_history(
+    session_id: str = Query(...),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None),
+):
+    return await cached_history(session_id, limit, cursor)
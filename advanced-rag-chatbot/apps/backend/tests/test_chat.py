@@ -0,0 +1,41 @@
+import pytest
+from httpx import AsyncClient
+from app import app, chat
+from app.chat import _iter_sse_data
+
+
+async def _chunks(*parts: bytes):
+    for p in parts:
+        yield p
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_data_reassembles_split_frames():
+    stream = _chunks(b'data: {"a":', b' 1}\n\n: keep-alive\n\ndata: [DO', b"NE]\n\n")
+    batches = [b async for b in _iter_sse_data(stream)]
+    assert batches == [[], [b'{"a": 1}'], [b"[DONE]"]]
+
+    crlf = _chunks(b'data: {"a": 1}\r\n\r', b"\n: keep-alive\r\n\r\ndata: [DONE]\r\n\r\n")
+    batches = [b async for b in _iter_sse_data(crlf)]
+    assert batches == [[], [b'{"a": 1}', b"[DONE]"]]
+
+    fields = _chunks(b'event: message\ndata: {"a": 1}\n\ndata: {"b": 2}\nid: 7\n\ndata: {"c":\ndata: 3}\n\n')
+    batches = [b async for b in _iter_sse_data(fields)]
+    assert batches == [[b'{"a": 1}', b'{"b": 2}', b'{"c":\n3}']]
+
+
+@pytest.mark.asyncio
+async def test_chat_rejects_invalid_body_with_422():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        resp = await ac.post("/api/chat", json={"query": "", "top_k": 5})
+        assert resp.status_code == 422
+
+
+def test_build_messages_respects_context_budget(monkeypatch):
+    monkeypatch.setattr(chat, "_CONTEXT_MAX_CHARS", 10)
+    rows = [
+        {"chunk_id": "b", "content": "best-chunk"},
+        {"chunk_id": "a", "content": "second"},
+    ]
+    system = chat._build_messages("q", rows)[0]["content"]
+    assert system.endswith("Context:\nbest-chunk")
@@ -0,0 +1,71 @@
+import pytest
+from app import db
+
+
+class _Tx:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Conn:
+    def __init__(self):
+        self.executed = []
+
+    def transaction(self):
+        return _Tx()
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+
+    async def fetch(self, query, *args):
+        return []
+
+
+class _Pool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        conn = self.conn
+
+        class _Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+@pytest.mark.asyncio
+async def test_fetch_ann_raises_ef_search_only_above_the_pool_default(monkeypatch):
+    conn = _Conn()
+
+    async def _get_pool():
+        return _Pool(conn)
+
+    monkeypatch.setattr(db, "get_pool", _get_pool)
+    monkeypatch.setattr(db, "_EF_SEARCH", 200)
+    await db.fetch_ann("SELECT 1", ef_search=200)
+    assert conn.executed == []
+    await db.fetch_ann("SELECT 1", ef_search=400)
+    assert conn.executed == ["SET LOCAL hnsw.ef_search = 400"]
+
+
+@pytest.mark.asyncio
+async def test_pool_sets_ef_search_as_startup_parameter(monkeypatch):
+    captured = {}
+
+    async def _create_pool(**kwargs):
+        captured.update(kwargs)
+        return object()
+
+    monkeypatch.setattr(db.asyncpg, "create_pool", _create_pool)
+    monkeypatch.setattr(db, "_pool", None)
+    monkeypatch.setattr(db.get_settings(), "vector_db_url", "postgresql://localhost/test")
+    await db.get_pool()
+    assert captured["server_settings"] == {"hnsw.ef_search": str(db._EF_SEARCH)}
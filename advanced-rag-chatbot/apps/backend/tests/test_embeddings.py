@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from pgvector import HalfVector
+from app import embeddings
+from app.config import get_settings
+from app.embeddings import _embed_texts, embed_query
+
+
+class _LengthModel:
+    def encode(self, texts, **kwargs):
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_embed_texts_restores_input_order():
+    texts = ["ccc", "a", "bbbbb", "dd"]
+    vectors = await _embed_texts(_LengthModel(), texts)
+    assert vectors[:, 0].tolist() == [3.0, 1.0, 5.0, 2.0]
+
+
+@pytest.mark.asyncio
+async def test_embed_query_reuses_cached_vector():
+    class _CountingModel(_LengthModel):
+        calls = 0
+
+        def encode(self, texts, **kwargs):
+            self.calls += 1
+            return super().encode(texts, **kwargs)
+
+    model = _CountingModel()
+    first = await embed_query(model, "what is the refund policy")
+    second = await embed_query(model, "what is the refund policy")
+    assert second is first
+    assert model.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_reuses_stored_vectors_for_duplicate_content(monkeypatch):
+    missing = [
+        {"id": "c1", "content": "dup", "content_hash": "h-dup"},
+        {"id": "c2", "content": "fresh", "content_hash": "h-new"},
+    ]
+    stored = [{"content_hash": "h-dup", "embedding": HalfVector([0.5])}]
+    written = []
+
+    async def _fetch(query, *args):
+        return stored if args else missing
+
+    async def _executemany(query, rows):
+        written.extend(rows)
+
+    monkeypatch.setattr(embeddings, "fetch", _fetch)
+    monkeypatch.setattr(embeddings, "executemany", _executemany)
+    monkeypatch.setattr(embeddings, "get_model", lambda settings: _LengthModel())
+    result = await embeddings.generate_all_missing(settings=get_settings())
+
+    assert result == {"status": "ok", "generated": 2, "encoded": 1}
+    # Same conversion the registered halfvec codec applies to each bound value
+    encoded = [(v if isinstance(v, HalfVector) else HalfVector(v)).to_list() for _, v, _ in written]
+    assert encoded == [[0.5], [5.0]]
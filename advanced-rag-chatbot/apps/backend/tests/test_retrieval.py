@@ -0,0 +1,19 @@
+import numpy as np
+from app.retrieval import _fuse_scores
+
+
+def test_fuse_scores_weighted_sums_raw_scores():
+    dense = np.array([0.8, 0.6], dtype=np.float32)
+    overlap = np.array([0.0, 1.0], dtype=np.float32)
+    np.testing.assert_allclose(_fuse_scores([dense, overlap], [0.5, 0.5]), [0.4, 0.8])
+
+
+def test_fuse_scores_minmax_rescales_each_signal():
+    # Dense cosines sit in a narrow band; min-max stretches them to the full [0, 1]
+    dense = np.array([0.82, 0.80, 0.81], dtype=np.float32)
+    overlap = np.array([0.0, 0.5, 1.0], dtype=np.float32)
+    scores = _fuse_scores([dense, overlap], [0.5, 0.5], "minmax")
+    np.testing.assert_allclose(scores, [0.5, 0.25, 0.75], atol=1e-4)
+    # A constant signal contributes nothing rather than dividing by zero
+    flat = _fuse_scores([np.full(3, 0.7, dtype=np.float32)], [1.0], "minmax")
+    np.testing.assert_allclose(flat, [0.0, 0.0, 0.0])
@@ -0,0 +1,25 @@
+import numpy as np
+from app.semantic_cache import SemanticCache
+
+
+def _unit(*xs):
+    v = np.array(xs, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_hit_requires_similarity_and_matching_key():
+    cache = SemanticCache(capacity=4, threshold=0.97)
+    cache.put(_unit(1, 0, 0), (5, 0.0), "a")
+    assert cache.get(_unit(1, 0.05, 0), (5, 0.0)) == "a"
+    assert cache.get(_unit(1, 0.05, 0), (3, 0.0)) is None
+    assert cache.get(_unit(0, 1, 0), (5, 0.0)) is None
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache(capacity=2, threshold=0.99)
+    cache.put(_unit(1, 0, 0), None, "x")
+    cache.put(_unit(0, 1, 0), None, "y")
+    cache.get(_unit(1, 0, 0), None)
+    cache.put(_unit(0, 0, 1), None, "z")
+    assert cache.get(_unit(1, 0, 0), None) == "x"
+    assert cache.get(_unit(0, 1, 0), None) is None
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+import pytest
+from fastapi import HTTPException
+from app import sessions
+from app.schemas import ChatHistoryResponse
+
+
+@pytest.mark.asyncio
+async def test_history_cache_hits_until_invalidated(monkeypatch):
+    calls = []
+
+    async def _load(session_id, limit, cursor):
+        calls.append((session_id, limit, cursor))
+        return ChatHistoryResponse(messages=[])
+
+    monkeypatch.setattr(sessions, "load_history", _load)
+    first = await sessions.cached_history("s1", 50, None)
+    second = await sessions.cached_history("s1", 50, None)
+    sessions.invalidate_history("s1")
+    third = await sessions.cached_history("s1", 50, None)
+    assert [r.headers["X-Cache"] for r in (first, second, third)] == ["MISS", "HIT", "MISS"]
+    assert first.body == second.body == b'{"messages":[],"next_cursor":null}'
+    assert len(calls) == 2
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    created_at = datetime(2024, 5, 1, 12, 30, 0, 123456, tzinfo=timezone.utc)
+    row_id = uuid4()
+    assert sessions._decode_cursor(sessions._encode_cursor(created_at, row_id)) == (created_at, row_id)
+    with pytest.raises(HTTPException):
+        sessions._decode_cursor("not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_expired_sessions_are_dropped_from_the_head(monkeypatch):
+    async def _load(session_id, limit, cursor):
+        return ChatHistoryResponse(messages=[])
+
+    clock = [100.0]
+    monkeypatch.setattr(sessions, "load_history", _load)
+    monkeypatch.setattr(sessions, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(sessions, "_history_cache", sessions.OrderedDict())
+    await sessions.cached_history("old", 50, None)
+    clock[0] += sessions._HISTORY_CACHE_TTL + 1
+    await sessions.cached_history("new", 50, None)
+    assert list(sessions._history_cache) == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_page_read_before_invalidation_is_not_cached(monkeypatch):
+    async def _load(session_id, limit, cursor):
+        # A chat turn commits while this page's SELECT is still in flight
+        sessions.invalidate_history(session_id)
+        return ChatHistoryResponse(messages=[])
+
+    monkeypatch.setattr(sessions, "load_history", _load)
+    await sessions.cached_history("racy", 50, None)
+    assert "racy" not in sessions._history_cache
+    assert "racy" not in sessions._history_loads
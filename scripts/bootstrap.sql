@@ -41,15 +41,15 @@ CREATE TABLE IF NOT EXISTS chunks (
 CREATE TABLE IF NOT EXISTS embeddings (
   id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
   chunk_id UUID REFERENCES chunks(id) ON DELETE CASCADE,
-  embedding vector(768) NOT NULL,
+  embedding halfvec(768) NOT NULL,
   model_version TEXT DEFAULT 'all-mpnet-base-v2',
   created_at TIMESTAMPTZ DEFAULT NOW(),
   UNIQUE(chunk_id)
 );
 
--- Vector index tuned for cosine similarity
-CREATE INDEX IF NOT EXISTS embeddings_vec_cos_idx
-  ON embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- HNSW inner-product index; embeddings are stored L2-normalized so this ranks by cosine
+CREATE INDEX IF NOT EXISTS embeddings_vec_ip_idx
+  ON embeddings USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
 
 -- Create chat history table
 CREATE TABLE IF NOT EXISTS chat_history (
@@ -62,6 +62,11 @@ CREATE TABLE IF NOT EXISTS chat_history (
   created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Indexes for per-session listings ordered by recency
+CREATE INDEX IF NOT EXISTS chat_history_session_created_id_idx ON chat_history(session_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS documents_session_created_idx ON documents(session_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS chunks_content_hash_idx ON chunks(content_hash);
+
 -- Validation query to test extensions
 DO $$
 BEGIN